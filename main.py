@@ -1,18 +1,20 @@
+import asyncio
+import hashlib
+import json
 import os
-import glob
-from datetime import datetime, timedelta
+import time
+from bisect import bisect_right
+from itertools import accumulate
+from datetime import datetime
 from typing import List, Dict
 
-import openai
-import praw
-import requests
-from dotenv import load_dotenv
-from openai.types.chat import ChatCompletionSystemMessageParam, ChatCompletionUserMessageParam
-
 SUBREDDIT_MAX_POSTS = 8
 POST_MAX_COMMENTS = 21
+POST_COMMENTS_MAX_CHARS = 3000
+TELEGRAM_MAX_CHARS = 4096
 OPENAI_MODEL="gpt-5-mini"
 OPENAI_MAX_COMPLETION_TOKENS = 4000
+OPENAI_MAX_RETRIES = 5
 OPENAI_MESSAGE_SYSTEM="""
 You are a financial analyst. 
 """
@@ -21,6 +23,8 @@ Summarize this into numbered list with a few key items. No need to list everythi
 Add new lines between list items. Use notation like 1) for item start. 
 Find best stock that will go up very soon. This is your main goal. 
 Find main market sentiments.
+The input has sections delimited by '~~~SUBREDDIT: name'.
+Summarize each section as its own list titled r/name, then append an overall summary across all sections.
 Don't use company names, use stock names instead. 
 For stock names use notation like $TSLA with a $. 
 At the end of every list item append without new lines:
@@ -30,148 +34,304 @@ No markdown.
 DO NOT GO OVER 3000 characters:\n\n
 """
 
+# shared client so Telegram sends and Reddit JSON fetches reuse TCP/TLS connections;
+# created on first use so importing httpx doesn't slow cold start
+http_client = None
+
+
+def get_http_client():
+    global http_client
+    if http_client is None:
+        import httpx
+        http_client = httpx.AsyncClient(limits=httpx.Limits(max_keepalive_connections=20))
+    return http_client
 
-def send_telegram_message(text: str):
+
+async def send_telegram_message(text: str):
     url = f"https://api.telegram.org/bot{os.getenv('TELEGRAM_BOT_TOKEN')}/sendMessage"
     payload = {
         "chat_id": os.getenv("TELEGRAM_CHAT_ID"),
         "text": text,
         "disable_web_page_preview": True,
     }
-    requests.post(url, json=payload, timeout=15)
+    await get_http_client().post(url, json=payload, timeout=15)
     return None
 
 
+class RateLimiter:
+    # rolling per-minute request/token budgets, as in openai-cookbook's
+    # api_request_parallel_processor; budgets refill continuously
+    def __init__(self, max_requests_per_minute: int, max_tokens_per_minute: int):
+        self.max_requests = max_requests_per_minute
+        self.max_tokens = max_tokens_per_minute
+        self.request_budget = float(max_requests_per_minute)
+        self.token_budget = float(max_tokens_per_minute)
+        self.updated = time.monotonic()
+
+    async def acquire(self, tokens: int):
+        while True:
+            now = time.monotonic()
+            elapsed = now - self.updated
+            self.updated = now
+            self.request_budget = min(self.max_requests, self.request_budget + self.max_requests * elapsed / 60)
+            self.token_budget = min(self.max_tokens, self.token_budget + self.max_tokens * elapsed / 60)
+            if self.request_budget >= 1 and self.token_budget >= tokens:
+                self.request_budget -= 1
+                self.token_budget -= tokens
+                return
+            await asyncio.sleep(1)
+
+
 class RedditSummarizer:
     def __init__(self, output_dir):
+        # heavy imports deferred to construction time to keep cold start fast
+        import asyncpraw
+        import openai
+
         self.output_dir = output_dir
-        self.reddit = praw.Reddit(
+        self.reddit = asyncpraw.Reddit(
             client_id=os.getenv('REDDIT_CLIENT_ID'),
             client_secret=os.getenv('REDDIT_CLIENT_SECRET'),
             user_agent='WSB-Summarizer/1.0'
         )
-        self.openai_client = openai.OpenAI(
+        self.openai_client = openai.AsyncOpenAI(
             api_key=os.getenv('OPENAI_API_KEY')
         )
+        self.openai_limiter = RateLimiter(
+            int(os.getenv('OPENAI_MAX_REQUESTS_PER_MINUTE', '60')),
+            int(os.getenv('OPENAI_MAX_TOKENS_PER_MINUTE', '200000')),
+        )
+        self.write_tasks: List[asyncio.Task] = []
 
     @staticmethod
-    def get_submission_comments(submission) -> List[str]:
+    async def get_submission_comments(submission) -> List[str]:
+        # one .json fetch returns the whole tree; replace_more paid one request per "load more" node
         comments = []
         try:
-            submission.comments.replace_more(limit=POST_MAX_COMMENTS)
+            # limit + depth=1 + sort=top keep the payload to the top-level comments we actually use
+            url = f"https://www.reddit.com{submission.permalink}.json?limit={POST_MAX_COMMENTS + 1}&depth=1&sort=top"
+            r = await get_http_client().get(url, headers={"User-Agent": "WSB-Summarizer/1.0"}, timeout=15)
+            data = r.json()
+            total_chars = 0
             # skip first, it's user report + ads
-            for c in submission.comments.list()[1:]:
-                body = getattr(c, 'body', None)
+            for c in data[1]["data"]["children"][1:POST_MAX_COMMENTS + 1]:
+                body = c["data"].get("body")
                 if not body:
                     continue
+                # the prompt keeps at most POST_COMMENTS_MAX_CHARS per post, so don't clean more than that
+                if len(body) > POST_COMMENTS_MAX_CHARS:
+                    body = body[:POST_COMMENTS_MAX_CHARS]
                 # remove all newlines
-                b = " ".join(body.splitlines()).strip()
+                b = body.replace("\n", " ").replace("\r", " ").strip()
                 comments.append(b)
-                if len(comments) >= POST_MAX_COMMENTS:
+                total_chars += len(b)
+                if total_chars >= POST_COMMENTS_MAX_CHARS:
                     break
         except Exception:
             pass
         return comments
 
-    def get_today_posts(self, subreddit) -> List[Dict]:
-        subreddit = self.reddit.subreddit(subreddit)
-        cutoff_ts = (datetime.utcnow() - timedelta(hours=24)).timestamp()
-        posts = []
-        for submission in subreddit.new(limit=SUBREDDIT_MAX_POSTS):
-            print(f"Fetching {subreddit} post #{len(posts) + 1}...")
-            if submission.created_utc >= cutoff_ts:
-                comments = self.get_submission_comments(submission)
-                posts.append({
-                    'title': submission.title,
-                    'score': submission.score,
-                    'num_comments': submission.num_comments,
-                    'selftext': submission.selftext[:1000] if submission.selftext else '',
-                    'shortlink': submission.shortlink,
-                    'created_utc': submission.created_utc,
-                    'comments': comments
-                })
-        return posts
+    async def get_today_posts(self, subreddits: List[str], cutoff_ts: float) -> Dict[str, List[Dict]]:
+        # a single /r/a+b+c/new listing replaces one request per subreddit
+        combined = await self.reddit.subreddit("+".join(subreddits))
+        limit = SUBREDDIT_MAX_POSTS * len(subreddits)
+        submissions = [s async for s in combined.new(limit=limit) if s.created_utc >= cutoff_ts]
+        print(f"Fetching comments for {len(submissions)} posts across {len(subreddits)} subreddits...")
+        # fetch all comment trees concurrently instead of stalling on each post in turn
+        comments_list = await asyncio.gather(*(self.get_submission_comments(s) for s in submissions))
+        posts_by_sub: Dict[str, List[Dict]] = {sub: [] for sub in subreddits}
+        for submission, comments in zip(submissions, comments_list):
+            posts = posts_by_sub.get(submission.subreddit.display_name)
+            if posts is None or len(posts) >= SUBREDDIT_MAX_POSTS:
+                continue
+            posts.append({
+                'title': submission.title,
+                'score': submission.score,
+                'num_comments': submission.num_comments,
+                'selftext': submission.selftext[:1000] if submission.selftext else '',
+                'shortlink': submission.shortlink,
+                'created_utc': submission.created_utc,
+                'comments': comments
+            })
+        return posts_by_sub
 
     @staticmethod
     def prepare_posts_for_summary(subreddit, posts: List[Dict]) -> str:
         if not posts:
             return "No posts found for today."
         posts_sorted = sorted(posts, key=lambda x: x['score'], reverse=True)
-        summary_text = f"Today's Reddit r/{subreddit} posts:\n\n"
+        # collect fragments and join once; += on a growing string re-copies the whole buffer
+        parts: List[str] = [f"Today's Reddit r/{subreddit} posts:\n\n"]
         for i, post in enumerate(posts_sorted, 1):
-            summary_text += f"~~~POST #{i} START\n"
-            summary_text += f"Title: {post['title']}\n"
-            summary_text += f"Score: {post['score']}\n"
-            summary_text += f"Comments: {post['num_comments']}\n"
-            summary_text += f"Link: {post['shortlink']}\n"
+            parts.append(f"~~~POST #{i} START\n")
+            parts.append(f"Title: {post['title']}\n")
+            parts.append(f"Score: {post['score']}\n")
+            parts.append(f"Comments: {post['num_comments']}\n")
+            parts.append(f"Link: {post['shortlink']}\n")
             if post.get('selftext'):
-                summary_text += f"Post content: {post['selftext'][:1500]}...\n\n"
+                parts.append(f"Post content: {post['selftext'][:1500]}...\n\n")
             # Incorporate comments: join all comments; to keep prompt manageable, trim very long combined text
             comments = post.get('comments') or []
             if comments:
-                combined = " \n- ".join(comments)
                 # Soft cap per-post comments text to avoid exceeding context; still uses all comments content insofar as possible
-                max_chars = 3000
-                if len(combined) > max_chars:
-                    combined = combined[:max_chars] + "..."
-                summary_text += f"Comments:\n- {combined}\n"
-            summary_text += f"~~~POST #{i} END\n\n"
-        return summary_text
-
-    def summarize_with_openai(self, text: str) -> str:
+                sep = " \n- "
+                max_chars = POST_COMMENTS_MAX_CHARS
+                # prefix sums of the joined length, so only the kept region is ever joined
+                cum = list(accumulate(len(c) + len(sep) for c in comments))
+                k = bisect_right(cum, max_chars + len(sep))
+                if k == len(comments):
+                    combined = sep.join(comments)
+                else:
+                    # include the straggler, then trim it to the cap
+                    combined = sep.join(comments[:k + 1])[:max_chars] + "..."
+                parts.append(f"Comments:\n- {combined}\n")
+            parts.append(f"~~~POST #{i} END\n\n")
+        return "".join(parts)
+
+    @staticmethod
+    def _cache_key(model: str, messages: List[Dict]) -> str:
+        payload = json.dumps({"model": model, "messages": messages}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _cache_path(self, key: str) -> str:
+        # shared across daily runs, so it lives next to the per-day folders
+        cache_dir = os.path.join(os.path.dirname(self.output_dir), "llm_cache")
+        os.makedirs(cache_dir, exist_ok=True)
+        return os.path.join(cache_dir, f"{key}.json")
+
+    @staticmethod
+    async def _send_in_chunks(text: str):
+        for i in range(0, len(text), TELEGRAM_MAX_CHARS):
+            await send_telegram_message(text[i:i + TELEGRAM_MAX_CHARS])
+
+    @staticmethod
+    async def _send_after(prev, text: str):
+        # chain sends so messages reach Telegram in order while still overlapping the stream
+        if prev is not None:
+            await prev
+        await send_telegram_message(text)
+
+    async def summarize_with_openai(self, text: str, header: str = "") -> str:
+        import openai
+        from openai.types.chat import ChatCompletionSystemMessageParam, ChatCompletionUserMessageParam
+
         print("Generating summary with OpenAI...")
+        # keep the static prefix in its own messages so OpenAI's prompt caching
+        # can reuse it across calls; only the trailing message varies
+        messages = [
+            ChatCompletionSystemMessageParam(role="system", content=OPENAI_MESSAGE_SYSTEM),
+            ChatCompletionUserMessageParam(role="user", content=OPENAI_MESSAGE_USER),
+            ChatCompletionUserMessageParam(role="user", content=text)
+        ]
+        cache_path = self._cache_path(self._cache_key(OPENAI_MODEL, messages))
+        content = None
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                content = json.load(f)["content"]
+        except Exception:
+            pass
+        if content is not None:
+            try:
+                await self._send_in_chunks(header + content)
+            except Exception as e:
+                print(f"Telegram delivery failed: {str(e)}")
+            return header + content
+        parts: List[str] = []
+        pending = header
+        last_send = None
+        try:
+            # rough chars/4 input estimate plus the completion budget
+            estimated_tokens = len(OPENAI_MESSAGE_USER + text) // 4 + OPENAI_MAX_COMPLETION_TOKENS
+            for attempt in range(OPENAI_MAX_RETRIES):
+                await self.openai_limiter.acquire(estimated_tokens)
+                try:
+                    stream = await self.openai_client.chat.completions.create(
+                        model=OPENAI_MODEL,
+                        messages=messages,
+                        max_completion_tokens=OPENAI_MAX_COMPLETION_TOKENS,
+                        stream=True,
+                    )
+                    break
+                except openai.RateLimitError as e:
+                    if attempt == OPENAI_MAX_RETRIES - 1:
+                        raise
+                    retry_after = float(e.response.headers.get("retry-after", 2 ** attempt))
+                    print(f"OpenAI rate limit hit, retrying in {retry_after}s...")
+                    await asyncio.sleep(retry_after)
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                parts.append(delta)
+                pending += delta
+                if len(pending) >= TELEGRAM_MAX_CHARS:
+                    # flush on the last newline so list items stay intact
+                    cut = pending.rfind("\n", 0, TELEGRAM_MAX_CHARS)
+                    cut = cut if cut > 0 else TELEGRAM_MAX_CHARS
+                    last_send = asyncio.create_task(self._send_after(last_send, pending[:cut]))
+                    pending = pending[cut:].lstrip("\n")
+            content = "".join(parts)
+            # persist before awaiting delivery so a failed send can't lose the summary
+            with open(cache_path, "w", encoding="utf-8") as f:
+                json.dump({"content": content}, f)
+        except Exception as e:
+            content = f"Error generating summary: {str(e)}"
+            pending = content if last_send is not None else header + content
+        if pending:
+            last_send = asyncio.create_task(self._send_after(last_send, pending))
         try:
-            response = self.openai_client.chat.completions.create(
-                model=OPENAI_MODEL,
-                messages=[
-                    ChatCompletionSystemMessageParam(role="system", content=OPENAI_MESSAGE_SYSTEM),
-                    ChatCompletionUserMessageParam(role="user", content=OPENAI_MESSAGE_USER + text)
-                ],
-                max_completion_tokens=OPENAI_MAX_COMPLETION_TOKENS,
-            )
-            return response.choices[0].message.content
+            if last_send is not None:
+                await last_send
         except Exception as e:
-            return f"Error generating summary: {str(e)}"
+            # delivery failure must not discard the generated summary
+            print(f"Telegram delivery failed: {str(e)}")
+        return header + content
 
     def write_output_file(self, name=None, text=None):
         with open(os.path.join(self.output_dir, name), "w", encoding="utf-8") as f:
             f.write(text)
 
-    @staticmethod
-    def collect_summaries_in_folder(folder: str) -> str:
-        paths = sorted(glob.glob(os.path.join(folder, "*-summary.txt")))
-        chunks: List[str] = []
-        for path in paths:
-            try:
-                with open(path, "r", encoding="utf-8") as f:
-                    chunks.append(f.read().strip())
-            except Exception:
-                continue
-        return "\n\n".join([c for c in chunks if c])
+    def write_output_file_in_background(self, name=None, text=None):
+        # queue the write so it overlaps the network calls; flushed before amain exits
+        self.write_tasks.append(asyncio.create_task(asyncio.to_thread(self.write_output_file, name, text)))
 
-    def run(self, subreddit: str) -> str:
+    async def run(self, subreddit: str, posts: List[Dict]) -> str:
         print(f"🚀 Starting r/{subreddit} Today's Summary")
         print("=" * 50)
         try:
-            if True:
-                posts = self.get_today_posts(subreddit)
-                posts_text = self.prepare_posts_for_summary(subreddit, posts)
-            else:
-                with open(os.path.join(self.output_dir, f"{subreddit}.txt"), "r", encoding="utf-8") as f:
-                    posts_text = f.read()
-            summary = f"📊 TODAY'S r/{subreddit} SUMMARY\n\n"
-            summary += self.summarize_with_openai(posts_text)
-            self.write_output_file(f"{subreddit}.txt", posts_text)
-            self.write_output_file(f"{subreddit}-summary.txt", summary)
+            posts_text = self.prepare_posts_for_summary(subreddit, posts)
+            self.write_output_file_in_background(f"{subreddit}.txt", posts_text)
             print("=" * 50)
-            send_telegram_message(summary)
-            return summary
+            return posts_text
         except Exception as e:
             print(f"Error: {str(e)}")
             return ""
 
+    async def close(self):
+        await self.reddit.close()
+
+
+async def amain(day_output: str):
+    summarizer = RedditSummarizer(day_output)
+    try:
+        subs = ["wallstreetbets", "stocks", "investing", "swingtrading", "StockMarket", "Economics"]
+        cutoff_ts = time.time() - 24 * 3600
+        posts_by_sub = await summarizer.get_today_posts(subs, cutoff_ts)
+        posts_texts = await asyncio.gather(*(summarizer.run(sub, posts_by_sub[sub]) for sub in subs))
+        # one OpenAI round-trip over all sections instead of 6 per-sub calls + a global one
+        sections = "\n\n".join(f"~~~SUBREDDIT: {sub}\n\n{text}" for sub, text in zip(subs, posts_texts) if text)
+        summary = await summarizer.summarize_with_openai(sections, header=f"📊 TODAY'S SUMMARY\n\n")
+        summarizer.write_output_file_in_background(f"summary.txt", summary)
+    finally:
+        await asyncio.gather(*summarizer.write_tasks)
+        await summarizer.close()
+        if http_client is not None:
+            await http_client.aclose()
+
 
 def main():
+    from dotenv import load_dotenv
+
     load_dotenv()
     required_vars = [
         'REDDIT_CLIENT_ID',
@@ -187,14 +347,7 @@ def main():
     date_str = datetime.now().strftime('%Y-%m-%d')
     day_output = os.path.join(base_output, date_str)
     os.makedirs(day_output, exist_ok=True)
-    summarizer = RedditSummarizer(day_output)
-    for sub in ["wallstreetbets", "stocks", "investing", "swingtrading", "StockMarket", "Economics"]:
-        summarizer.run(sub)
-    summaries = summarizer.collect_summaries_in_folder(day_output)
-    summary = f"📊 TODAY'S SUMMARY\n\n"
-    summary += summarizer.summarize_with_openai(summaries)
-    summarizer.write_output_file(f"summary.txt", summary)
-    send_telegram_message(summary)
+    asyncio.run(amain(day_output))
 
 
 if __name__ == "__main__":